@@ -8,12 +8,47 @@ containing the image/video frame and its corresponding metadata.
 """
 import os
 import json
-import cv2  # OpenCV is needed to read video frames
+import shutil
+import subprocess
+import tempfile
+import cv2  # OpenCV is the fallback for reading video frames when ffmpeg is missing
 from PIL import Image
 from docx import Document
+from xml.sax.saxutils import escape
 from docx.shared import Inches, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from config import IMAGE_FOLDER, METADATA_JSON_FILE, OUTPUT_DOCX_FILE, PEOPLE_TO_ADD
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from config import (IMAGE_FOLDER, METADATA_JSON_FILE, OUTPUT_DOCX_FILE, PEOPLE_TO_ADD, MAX_PAGES_PER_DOCUMENT,
+                    SUPPORTED_VIDEO_EXTS)
+from meta_reader import read_video_metadata
+
+FFMPEG_PATH = shutil.which('ffmpeg')
+# Frames wider than this are scaled down; the page only shows ~7 inches anyway.
+VIDEO_FRAME_MAX_WIDTH = 1280
+
+# Size of the picture on the page, and the pixel density it is downscaled to
+# before embedding (96 DPI doubled for high-DPI screens).
+LANDSCAPE_WIDTH_IN = 7.0
+PORTRAIT_HEIGHT_IN = 5.7
+EMBED_DPI = 192
+
+# A mapping of technical keys to their user-friendly names.
+PRETTY_NAMES = {
+    'GPS_Location': 'GPS Location',
+    'Location_Address': 'Location Address',
+    'DeviceMake': 'Device Make',
+    'DeviceModel': 'Device Model',
+    'FocalLength': 'Focal Length',
+    'ShutterSpeed': 'Shutter Speed'
+}
+# The metadata fields listed on each page, in order. 'Comments' is left out
+# because it is written separately as the description.
+METADATA_FIELDS = ['OriginalFileName', 'Timestamp', 'People', 'Dimensions',
+                   'DeviceMake', 'DeviceModel', 'FocalLength', 'Aperture', 'ShutterSpeed',
+                   'ISO', 'Flash', 'GPS_Location', 'Location_Address']
+# (key, display name) pairs, resolved once instead of per field per page
+FIELD_ORDER = [(key, PRETTY_NAMES.get(key, key)) for key in METADATA_FIELDS]
 
 def load_metadata_from_json(json_path):
     """
@@ -29,11 +64,39 @@ def load_metadata_from_json(json_path):
     print(f"Successfully loaded metadata for {len(data)} photos.")
     return data
 
+def extract_frame_with_ffmpeg(video_path, output_image_path):
+    """
+    Extracts the middle frame from a video with ffmpeg, scaled down to VIDEO_FRAME_MAX_WIDTH.
+    Seeking before the input makes ffmpeg decode only the GOP around the target time.
+    Returns True on success, False on failure.
+    """
+    metadata = read_video_metadata(video_path)
+    if not metadata or not metadata.has('duration'):
+        return False
+    middle_ts = metadata.get('duration').total_seconds() / 2
+
+    command = [FFMPEG_PATH, '-v', 'error', '-ss', f"{middle_ts:.3f}", '-i', video_path,
+               '-frames:v', '1', '-vf', f"scale='min({VIDEO_FRAME_MAX_WIDTH},iw)':-2",
+               '-y', output_image_path]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=False)
+    except OSError as e:
+        print(f"Could not run ffmpeg: {e}")
+        return False
+    if result.returncode != 0 or not os.path.exists(output_image_path):
+        print(f"ffmpeg could not extract a frame from {video_path}: {result.stderr.strip()}")
+        return False
+    return True
+
 def extract_frame_from_video(video_path, output_image_path):
     """
     Extracts the middle frame from a video and saves it as a temporary image file.
+    Uses ffmpeg when it is installed, otherwise OpenCV.
     Returns True on success, False on failure.
     """
+    if FFMPEG_PATH and extract_frame_with_ffmpeg(video_path, output_image_path):
+        return True
+
     try:
         cap = cv2.VideoCapture(video_path)  # pylint: disable=no-member
         if not cap.isOpened():
@@ -55,117 +118,183 @@ def extract_frame_from_video(video_path, output_image_path):
         print(f"An error occurred while extracting frame: {e}")
         return False
 
-def create_word_document(media_folder, metadata_dict, people_in_photo):
+def cap_first(text):
     """
-    Creates a Word document from images and video frames with your specific formatting.
+    Upper-cases the first character only. Unlike str.capitalize(), the rest is
+    left as-is, so names like 'iPhone' and addresses keep their casing.
     """
-    if not os.path.isdir(media_folder):
-        print(f"Error: Media folder not found at '{media_folder}'")
-        return
+    return text[:1].upper() + text[1:]
 
-    print("Creating Word document...")
+def run_xml(text, bold=False):
+    """
+    Builds the XML for one text run, turning tabs into <w:tab/> and each CR or
+    LF into <w:br/> the same way python-docx's add_run() does.
+    """
+    escaped = escape(text)
+    for char, tag in (('\t', '<w:tab/>'), ('\n', '<w:br/>'), ('\r', '<w:br/>')):
+        escaped = escaped.replace(char, f'</w:t>{tag}<w:t xml:space="preserve">')
+    run_properties = '<w:rPr><w:b/></w:rPr>' if bold else ''
+    return f'<w:r>{run_properties}<w:t xml:space="preserve">{escaped}</w:t></w:r>'
+
+def metadata_line_xml(field_name, value=None):
+    """
+    Builds the XML for a "Field: value" paragraph with a bold label and no space after.
+    Building the XML directly is much cheaper than going through python-docx's
+    Paragraph/Run objects for the dozen lines on every page.
+    """
+    runs = run_xml(f'{field_name}: ', bold=True)
+    if value is not None:
+        runs += run_xml(value)
+    return f'<w:p {nsdecls("w")}><w:pPr><w:spacing w:after="0"/></w:pPr>{runs}</w:p>'
+
+def downscale_for_document(image_path, output_path):
+    """
+    Saves a JPEG copy of an image no larger than it will be shown on the page.
+    python-docx embeds the raw file bytes, so embedding full-resolution
+    photos makes the document huge and slow to save.
+    Returns True if the image is landscape, False if portrait or square.
+    """
+    with Image.open(image_path) as img:
+        is_landscape = img.width > img.height
+        max_side_px = int((LANDSCAPE_WIDTH_IN if is_landscape else PORTRAIT_HEIGHT_IN) * EMBED_DPI)
+        img.thumbnail((max_side_px, max_side_px), Image.LANCZOS)
+        if img.has_transparency_data:
+            # JPEG has no alpha; flatten onto white so transparent areas don't turn black
+            rgba = img.convert('RGBA')
+            flattened = Image.new('RGB', rgba.size, (255, 255, 255))
+            flattened.paste(rgba, mask=rgba.getchannel('A'))
+        else:
+            flattened = img.convert('RGB')
+        flattened.save(output_path, 'JPEG', quality=85)
+    return is_landscape
+
+def new_document():
+    """
+    Creates an empty Word document with the album's base style.
+    """
     document = Document()
     
     style = document.styles['Normal']
     font = style.font
     font.name = 'Calibri'
     font.size = Pt(11)
+    return document
 
-    for processed_filename, metadata in metadata_dict.items():
-        media_path = os.path.join(media_folder, processed_filename)
-        
-        if not os.path.exists(media_path):
-            print(f"Warning: Media file '{processed_filename}' not in folder. Skipping.")
-            continue
+def save_document(document, output_path):
+    try:
+        document.save(output_path)
+        print(f"\nSuccessfully created Word document: '{output_path}'")
+    except Exception as e:
+        print(f"Error saving document: {e}")
+
+def create_word_document(media_folder, metadata_dict, people_in_photo):
+    """
+    Creates a Word document from images and video frames with your specific formatting.
+    If MAX_PAGES_PER_DOCUMENT is set, the album is split into numbered volumes so
+    only one volume is held in memory at a time.
+    """
+    if not os.path.isdir(media_folder):
+        print(f"Error: Media folder not found at '{media_folder}'")
+        return
+
+    print("Creating Word document...")
+    document = new_document()
+    pages_in_document = 0
+    volume = 1
+    docx_base, docx_ext = os.path.splitext(OUTPUT_DOCX_FILE)
 
-        print(f"Adding '{metadata.get('OriginalFileName', '')}' to document...")
+    # One directory listing instead of an exists() check per file
+    with os.scandir(media_folder) as entries:
+        available_files = {entry.name for entry in entries}
 
-        original_filename = metadata.get('OriginalFileName', processed_filename)
-        is_video = original_filename.lower().endswith(('.mov', '.mp4'))
-        path_for_doc = None
-        temp_frame_path = None
+    # One scratch file holds each downscaled picture until it is embedded.
+    # It is removed even if a page fails to build.
+    fd, embed_path = tempfile.mkstemp(suffix='.jpg')
+    os.close(fd)
 
-        if is_video:
-            temp_frame_path = os.path.join(media_folder, f"_temp_frame_{processed_filename}.png")
-            if extract_frame_from_video(media_path, temp_frame_path):
-                path_for_doc = temp_frame_path
-            else:
-                print(f"Could not extract a frame from video '{processed_filename}'. Skipping.")
+    try:
+        for processed_filename, metadata in metadata_dict.items():
+            if processed_filename not in available_files:
+                print(f"Warning: Media file '{processed_filename}' not in folder. Skipping.")
                 continue
-        else:
-            path_for_doc = media_path
+            media_path = os.path.join(media_folder, processed_filename)
 
-        if metadata.get('People') == "NULL" and people_in_photo:
-            metadata['People'] = people_in_photo
+            print(f"Adding '{metadata.get('OriginalFileName', '')}' to document...")
 
-        heading_text = original_filename
-        if is_video:
-            heading_text += " (Video Frame)"
-        heading = document.add_heading(heading_text, level=2)
-        heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            original_filename = metadata.get('OriginalFileName', processed_filename)
+            is_video = os.path.splitext(original_filename)[1].lower() in SUPPORTED_VIDEO_EXTS
+            path_for_doc = None
+            temp_frame_path = None
 
-        with Image.open(path_for_doc) as img:
-            width_px, height_px = img.size
+            if is_video:
+                temp_frame_path = os.path.join(media_folder, f"_temp_frame_{processed_filename}.jpg")
+                if extract_frame_from_video(media_path, temp_frame_path):
+                    path_for_doc = temp_frame_path
+                else:
+                    print(f"Could not extract a frame from video '{processed_filename}'. Skipping.")
+                    continue
+            else:
+                path_for_doc = media_path
 
-        if width_px > height_px:  # Landscape
-            document.add_picture(path_for_doc, width=Inches(7.0))
-        else:  # Portrait or square
-            document.add_picture(path_for_doc, height=Inches(5.7))
-        
-        last_paragraph = document.paragraphs[-1]
-        last_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            if metadata.get('People') == "NULL" and people_in_photo:
+                metadata['People'] = people_in_photo
 
-        document.add_paragraph()
-        
-        # ==================== MODIFICATION START ====================
-        # This new, simplified loop correctly processes all metadata fields.
-        
-        # A mapping of technical keys to their user-friendly names.
-        pretty_names = {
-            'GPS_Location': 'GPS Location',
-            'Location_Address': 'Location Address',
-            'DeviceMake': 'Device Make',
-            'DeviceModel': 'Device Model',
-            'FocalLength': 'Focal Length',
-            'ShutterSpeed': 'Shutter Speed'
-        }
-
-        for key, value in metadata.items():
-            # Skip fields that are handled manually or not needed in this list
-            if key in ['Comments']:
-                continue
+            # Start the next volume only once a page is actually added to it,
+            # so skipped entries at the end never leave an empty volume.
+            if MAX_PAGES_PER_DOCUMENT and pages_in_document == MAX_PAGES_PER_DOCUMENT:
+                save_document(document, f"{docx_base}_{volume}{docx_ext}")
+                document = new_document()
+                pages_in_document = 0
+                volume += 1
 
-            # Use the pretty name if available, otherwise use the key as-is
-            field_name = pretty_names.get(key, key)
-            
-            # Your custom capitalization logic
-            field_content = value[0].upper() + value[1:] if isinstance(value, str) and value else value
-
-            # Add the formatted metadata line to the document
-            p = document.add_paragraph()
-            p.add_run(f'{field_name}: ').bold = True
-            p.add_run(str(field_content))
-            p.paragraph_format.space_after = Pt(0)
-        # ===================== MODIFICATION END =====================
-
-        p = document.add_paragraph()
-        p.add_run('Description: ').bold = True
-        p.paragraph_format.space_after = Pt(0)
+            heading_text = original_filename
+            if is_video:
+                heading_text += " (Video Frame)"
+            heading = document.add_heading(heading_text, level=2)
+            heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+            picture_paragraph = document.add_paragraph()
+            picture_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            # The layout is decided from the same open that downscales the picture
+            if downscale_for_document(path_for_doc, embed_path):  # Landscape
+                picture_paragraph.add_run().add_picture(embed_path, width=Inches(LANDSCAPE_WIDTH_IN))
+            else:  # Portrait or square
+                picture_paragraph.add_run().add_picture(embed_path, height=Inches(PORTRAIT_HEIGHT_IN))
+
+            document.add_paragraph()
         
-        comments = metadata.get('Comments')
-        if comments and comments != "NULL" and comments != "N/A":
-            p.add_run(comments)
+            # ==================== MODIFICATION START ====================
+            # This new, simplified loop correctly processes all metadata fields.
+            body = document.element.body
+            for key, field_name in FIELD_ORDER:
+                if key not in metadata:
+                    continue
+                value = metadata[key]
+            
+                # Your custom capitalization logic
+                field_content = cap_first(value) if isinstance(value, str) else str(value)
+
+                # Add the formatted metadata line to the document (before the section properties)
+                body._insert_p(parse_xml(metadata_line_xml(field_name, field_content)))  # pylint: disable=protected-access
+            # ===================== MODIFICATION END =====================
+
+            comments = metadata.get('Comments')
+            if not (comments and comments != "NULL" and comments != "N/A"):
+                comments = None
+            body._insert_p(parse_xml(metadata_line_xml('Description', comments)))  # pylint: disable=protected-access
         
-        document.add_page_break()
+            document.add_page_break()
+            pages_in_document += 1
 
-        if temp_frame_path and os.path.exists(temp_frame_path):
-            os.remove(temp_frame_path)
+            if temp_frame_path and os.path.exists(temp_frame_path):
+                os.remove(temp_frame_path)
+    finally:
+        os.remove(embed_path)
 
-    try:
-        document.save(OUTPUT_DOCX_FILE)
-        print(f"\nSuccessfully created Word document: '{OUTPUT_DOCX_FILE}'")
-    except Exception as e:
-        print(f"Error saving document: {e}")
+    if MAX_PAGES_PER_DOCUMENT:
+        save_document(document, f"{docx_base}_{volume}{docx_ext}")
+    else:
+        save_document(document, OUTPUT_DOCX_FILE)
 
 if __name__ == "__main__":
     if not PEOPLE_TO_ADD:
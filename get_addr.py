@@ -1,27 +1,134 @@
 """
-Function to get address.
+Functions to get addresses for GPS coordinates.
 """
-
+import functools
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from geopy.adapters import RequestsAdapter
 from geopy.extra.rate_limiter import RateLimiter
 from geopy.geocoders import Nominatim
+from config import GEOCODE_CACHE_FILE, GEOCODE_MAX_WORKERS, GEOCODE_PRECISION
+
+# Maps rounded "lat,lon" keys to addresses. Loaded from GEOCODE_CACHE_FILE on first use.
+_CACHE = None
+# Rate-limited reverse geocoder, built only once a lookup actually misses the cache.
+_geocode = None
+
+def _get_geocoder():
+    """
+    Returns the shared geocoder. A single Nominatim instance (and its pooled
+    requests.Session) serves every lookup, so the 1 request/second limit and
+    the HTTPS connection carry across calls.
+    """
+    global _geocode
+    if _geocode is None:
+        # One keep-alive connection per lookup worker
+        adapter_factory = functools.partial(RequestsAdapter, pool_connections=GEOCODE_MAX_WORKERS,
+                                            pool_maxsize=GEOCODE_MAX_WORKERS)
+        geolocator = Nominatim(user_agent="photo_metadata_extractor", adapter_factory=adapter_factory)
+        _geocode = RateLimiter(geolocator.reverse, min_delay_seconds=1, max_retries=3, swallow_exceptions=False)
+    return _geocode
+
+def _cache_key(lat_dd, lon_dd):
+    return f"{round(float(lat_dd), GEOCODE_PRECISION)},{round(float(lon_dd), GEOCODE_PRECISION)}"
+
+def _open_cache():
+    os.makedirs(os.path.dirname(GEOCODE_CACHE_FILE), exist_ok=True)
+    conn = sqlite3.connect(GEOCODE_CACHE_FILE)
+    conn.execute("CREATE TABLE IF NOT EXISTS geocode (coords TEXT PRIMARY KEY, addr TEXT)")
+    return conn
+
+def _load_cache():
+    global _CACHE
+    if _CACHE is not None:
+        return _CACHE
+    _CACHE = {}
+    if not os.path.exists(GEOCODE_CACHE_FILE):
+        return _CACHE
+    try:
+        conn = _open_cache()
+        try:
+            _CACHE.update(conn.execute("SELECT coords, addr FROM geocode"))
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Could not read geocode cache '{GEOCODE_CACHE_FILE}': {e}")
+    return _CACHE
+
+def _lookup(geocode, key):
+    """
+    Reverse geocodes a single cache key. Returns (address, cacheable).
+    """
+    lat_dd, lon_dd = map(float, key.split(','))
+    try:
+        location = geocode((lat_dd, lon_dd), language='en')
+    except Exception as e:
+        return f"Geocoding failed: {e}", False
+    return (location.address if location else "Address not found"), True
+
+def get_addrs(coords):
+    """
+    Resolves a list of (lat, lon) tuples to addresses.
+    Nearby points share one lookup, and results are cached on disk between runs.
+    Returns a dict mapping each (lat, lon) tuple to its address.
+    """
+    cache = _load_cache()
+    keys = {coord: _cache_key(*coord) for coord in coords}
+    unique_keys = set(keys.values())
+    missing = sorted(key for key in unique_keys if key not in cache)
+    results = {}
+    if unique_keys:
+        print(f"{len(unique_keys)} unique location(s): {len(unique_keys) - len(missing)} cached, "
+              f"{len(missing)} to look up.")
+
+    if missing:
+        try:
+            conn = _open_cache()
+        except (OSError, sqlite3.Error) as e:
+            # The cache is only an optimisation; look the points up uncached
+            print(f"Could not open geocode cache '{GEOCODE_CACHE_FILE}': {e}")
+            conn = None
+        try:
+            # Built before the workers start so they all share one RateLimiter, and with
+            # it the 1 request/second budget (RateLimiter is thread-safe)
+            lookup = functools.partial(_lookup, _get_geocoder())
+            with ThreadPoolExecutor(max_workers=GEOCODE_MAX_WORKERS) as executor:
+                for key, (addr, cacheable) in zip(missing, executor.map(lookup, missing)):
+                    results[key] = addr
+                    if cacheable:
+                        cache[key] = addr
+                        if conn:
+                            try:
+                                conn.execute("INSERT OR REPLACE INTO geocode VALUES (?, ?)", (key, addr))
+                            except sqlite3.Error as e:
+                                print(f"Could not write geocode cache '{GEOCODE_CACHE_FILE}': {e}")
+                                conn.close()
+                                conn = None
+        finally:
+            # Keep whatever was resolved, even if the run is interrupted.
+            if conn:
+                try:
+                    conn.commit()
+                except sqlite3.Error as e:
+                    print(f"Could not write geocode cache '{GEOCODE_CACHE_FILE}': {e}")
+                conn.close()
+
+    return {coord: cache.get(key, results.get(key)) for coord, key in keys.items()}
 
 def get_addr(lat_dd, lon_dd):
-    geolocator = Nominatim(user_agent="photo_metadata_extractor")
-    geocode = RateLimiter(geolocator.reverse, min_delay_seconds=1)
-    location = geocode((lat_dd, lon_dd), language='en')
-    addr = location.address if location else "Address not found"
-    return addr
+    return get_addrs([(lat_dd, lon_dd)])[(lat_dd, lon_dd)]
 
 if __name__ == "__main__":
     # # Step 1: Timestamp all images. This function creates the output
     # # folder and returns its path.
     # output_folder = process_folder_for_timestamping(SOURCE_IMAGE_FOLDER)
-    
+
     # # # Step 2: Generate the metadata report. We read from the SOURCE folder
     # # # to get original, unaltered metadata and save the report to the OUTPUT folder.
     # # if output_folder:
     # generate_metadata_report(SOURCE_IMAGE_FOLDER, OUTPUT_FOLDER_NAME)
-        
+
     # print("\nAll tasks complete.")
     lat_dd, lon_dd = -34.5530, -58.4676
     print(lat_dd, lon_dd)
@@ -1,30 +1,130 @@
 import datetime
+import functools
+import json
 import os
+import shutil
+import subprocess
+from fractions import Fraction
 from PIL import Image
 import piexif
 import pillow_heif
 from hachoir.parser import createParser
 from hachoir.metadata import extractMetadata
+from config import SUPPORTED_VIDEO_EXTS
 
-def get_creation_date(filepath):
+EXIFTOOL_PATH = shutil.which('exiftool')
+# The tags the metadata report needs, read in one ExifTool run for a whole folder
+EXIFTOOL_TAGS = ['DateTimeOriginal', 'Make', 'Model', 'FocalLength', 'FNumber', 'ExposureTime',
+                 'ISO', 'Flash', 'UserComment', 'ImageDescription', 'XPComment',
+                 'GPSLatitude', 'GPSLatitudeRef', 'GPSLongitude', 'GPSLongitudeRef']
+
+def _rational(value):
+    fraction = Fraction(value).limit_denominator(100000)
+    return (fraction.numerator, fraction.denominator)
+
+def _gps_dms(value):
+    # Decimal degrees stored as whole degrees with a 1e-7 denominator
+    return ((round(abs(value) * 10**7), 10**7), (0, 1), (0, 1))
+
+def exif_dict_from_exiftool(tags):
+    """
+    Rebuilds a piexif-style EXIF dict from one file's ExifTool JSON (-n) output,
+    so the report formats values from either source the same way.
+    """
+    exif_dict = {'0th': {}, 'Exif': {}, 'GPS': {}}
+    text_tags = [('0th', piexif.ImageIFD.Make, 'Make'), ('0th', piexif.ImageIFD.Model, 'Model'),
+                 ('0th', piexif.ImageIFD.ImageDescription, 'ImageDescription'),
+                 ('Exif', piexif.ExifIFD.DateTimeOriginal, 'DateTimeOriginal'),
+                 ('Exif', piexif.ExifIFD.UserComment, 'UserComment')]
+    for ifd, tag, name in text_tags:
+        if name in tags:
+            exif_dict[ifd][tag] = str(tags[name]).encode('utf-8')
+    if 'XPComment' in tags:
+        exif_dict['0th'][piexif.ImageIFD.XPComment] = str(tags['XPComment']).encode('utf-16-le')
+    for tag, name in [(piexif.ExifIFD.FocalLength, 'FocalLength'), (piexif.ExifIFD.FNumber, 'FNumber'),
+                      (piexif.ExifIFD.ExposureTime, 'ExposureTime')]:
+        if isinstance(tags.get(name), (int, float)):
+            exif_dict['Exif'][tag] = _rational(tags[name])
+    for tag, name in [(piexif.ExifIFD.ISOSpeedRatings, 'ISO'), (piexif.ExifIFD.Flash, 'Flash')]:
+        if isinstance(tags.get(name), int):
+            exif_dict['Exif'][tag] = tags[name]
+
+    lat, lon = tags.get('GPSLatitude'), tags.get('GPSLongitude')
+    if isinstance(lat, (int, float)) and isinstance(lon, (int, float)):
+        lat_ref = 'S' if lat < 0 or tags.get('GPSLatitudeRef') == 'S' else 'N'
+        lon_ref = 'W' if lon < 0 or tags.get('GPSLongitudeRef') == 'W' else 'E'
+        exif_dict['GPS'] = {piexif.GPSIFD.GPSLatitude: _gps_dms(lat), piexif.GPSIFD.GPSLatitudeRef: lat_ref.encode(),
+                            piexif.GPSIFD.GPSLongitude: _gps_dms(lon), piexif.GPSIFD.GPSLongitudeRef: lon_ref.encode()}
+    return exif_dict
+
+def read_exif_batch(file_paths):
+    """
+    Reads the EXIF of many images with a single ExifTool process instead of
+    parsing each file in Python.
+    Returns a dict mapping each path to a piexif-style EXIF dict. It is empty if
+    ExifTool is not installed, and files ExifTool could not read are left out,
+    so callers fall back to piexif for anything missing.
+    """
+    if not EXIFTOOL_PATH or not file_paths:
+        return {}
+
+    command = [EXIFTOOL_PATH, '-j', '-n', '-fast2', '-q', '-q']
+    command += [f'-{tag}' for tag in EXIFTOOL_TAGS]
+    command += ['-charset', 'filename=utf8', '-@', '-']  # File list is read from stdin
+    try:
+        result = subprocess.run(command, input='\n'.join(file_paths), capture_output=True,
+                                encoding='utf-8', check=False)
+        records = json.loads(result.stdout or '[]')
+    except (OSError, ValueError) as e:
+        print(f"ExifTool failed, falling back to piexif: {e}")
+        return {}
+    return {os.path.normpath(record['SourceFile']): exif_dict_from_exiftool(record) for record in records}
+
+@functools.lru_cache(maxsize=32)
+def read_video_metadata(filepath):
+    """
+    Parses a video's container header with hachoir, without decoding any frames.
+    Cached so the creation date and the dimensions of a video share one parse.
+    Returns the hachoir metadata object, or None if it could not be read.
+    """
+    try:
+        parser = createParser(filepath)
+        if not parser:
+            return None
+        with parser:
+            return extractMetadata(parser)
+    except Exception as e:
+        print(f"Could not read video metadata for {os.path.basename(filepath)}: {e}")
+        return None
+
+def get_creation_date(filepath, exif_dict=None):
     """
     Extracts the creation date from image or video metadata.
     Falls back to the file's last modification time if metadata is not found.
+    Callers that already parsed the image's EXIF can pass it as `exif_dict`
+    so the file is not opened and parsed a second time.
     """
     # --- Video Metadata Extraction using Hachoir ---
-    if filepath.lower().endswith(('.mov', '.mp4')):
-        try:
-            parser = createParser(filepath)
-            metadata = extractMetadata(parser)
-            if metadata and metadata.has('creation_date'):
-                return metadata.get('creation_date').strftime('%Y-%m-%d %H:%M:%S')
-        except Exception as e:
-            print(f"Could not read video metadata for {os.path.basename(filepath)}: {e}")
+    ext = os.path.splitext(filepath)[1].lower()
+    is_video = ext in SUPPORTED_VIDEO_EXTS
+    if is_video:
+        metadata = read_video_metadata(filepath)
+        if metadata and metadata.has('creation_date'):
+            return metadata.get('creation_date').strftime('%Y-%m-%d %H:%M:%S')
     
     # --- Image EXIF Metadata Extraction ---
     try:
-        if filepath.lower().endswith('.heic'):
-            heif_file = pillow_heif.read_heif(filepath)
+        if is_video:
+            # No image plugin can open a video; trying makes PIL load every plugin it has.
+            exif_dict = {}
+        elif exif_dict is not None:
+            pass
+        elif ext in ('.jpg', '.jpeg'):
+            # piexif reads only the APP1 segment straight from the file, skipping PIL
+            exif_dict = piexif.load(filepath)
+        elif ext == '.heic':
+            # Header-only handle: EXIF is available without decoding any pixels
+            heif_file = pillow_heif.open_heif(filepath, convert_hdr_to_8bit=False)
             if 'exif' in heif_file.info and heif_file.info['exif']:
                 exif_dict = piexif.load(heif_file.info['exif'])
             else:
@@ -1,155 +1,293 @@
 """
-Generate a text file and JSON report of all EXIF metadata for images and videos in a folder.
+Generate a JSON report of the EXIF metadata of all images and videos in a folder.
 """
 import os
 import piexif
 import json
-import cv2
+import numpy as np
+try:
+    import orjson  # Optional, faster JSON encoder
+except ImportError:
+    orjson = None
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
 from PIL import Image
 import pillow_heif
-from meta_reader import get_creation_date
-from get_addr import get_addr
-
-def dms_to_dd(dms, ref):
-    """Converts GPS DMS (degrees, minutes, seconds) to DD (decimal degrees)"""
-    degrees = dms[0][0] / dms[0][1]
-    minutes = dms[1][0] / dms[1][1] / 60.0
-    seconds = dms[2][0] / dms[2][1] / 3600.0
-    dd = degrees + minutes + seconds
-    if ref in ['S', 'W']:
-        dd *= -1
+from meta_reader import get_creation_date, read_video_metadata, read_exif_batch
+from get_addr import get_addrs
+from config import METADATA_REPORT_NAME, SUPPORTED_IMAGE_EXTS, SUPPORTED_VIDEO_EXTS
+
+def dms_to_dd(dms, refs):
+    """
+    Converts GPS DMS (degrees, minutes, seconds) to DD (decimal degrees).
+    Takes an array of (numerator, denominator) rationals shaped (..., 3, 2) and
+    matching 'N'/'S'/'E'/'W' refs, and converts all points in one vectorized pass.
+    Points with a zero denominator come out as NaN or inf.
+    """
+    dms = np.asarray(dms, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        parts = dms[..., 0] / dms[..., 1]
+    dd = parts[..., 0] + parts[..., 1] / 60.0 + parts[..., 2] / 3600.0
+    dd[np.isin(refs, ['S', 'W'])] *= -1
     return dd
 
-def generate_metadata_report(source_folder, output_folder):
+def processed_name(filename, ext):
     """
-    Generates a text and JSON report of metadata from original source files.
+    Returns the name the timestamper gives the processed copy of a source file.
     """
-    print("\n--- Starting Metadata Report Generation ---")
-    report_path_json = os.path.join(output_folder, "metadata_report.json")
-    all_media_data = {}
+    return os.path.splitext(filename)[0] + (".mp4" if ext in SUPPORTED_VIDEO_EXTS else ".png")
 
-    supported_media = ('.png', '.jpg', '.jpeg', '.heic', '.mov', '.mp4')
+def load_previous_report(report_path):
+    """
+    Loads the report written by an earlier run.
+    Returns {} if there is no usable report.
+    """
+    try:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    for filename in os.listdir(source_folder):
-        if not filename.lower().endswith(supported_media):
-            continue
+def _text(value):
+    # Bytes are decoded as UTF-8; values that are already str (or numbers) pass through
+    return value.decode('utf-8', 'ignore').strip('\x00') if isinstance(value, bytes) else value
 
-        file_path = os.path.join(source_folder, filename)
-        is_video = filename.lower().endswith(('.mov', '.mp4'))
-        
-        try:
-            timestamp = get_creation_date(file_path) or "NULL"
+def _utf16_text(value):
+    # piexif returns XPComment as a tuple of byte values
+    if isinstance(value, (bytes, tuple)):
+        return bytes(value).decode('utf-16-le', 'ignore').strip('\x00')
+    return value
+
+def _user_comment(value):
+    # The first 8 bytes name the character code; anything else is read as UTF-8
+    if isinstance(value, tuple):
+        return _utf16_text(value)
+    if isinstance(value, bytes):
+        if value.startswith(b'UNICODE\x00'): return value[8:].decode('utf-16-le', 'ignore').strip('\x00')
+        if value.startswith(b'ASCII\x00\x00\x00'): return value[8:].decode('ascii', 'ignore').strip('\x00')
+    return _text(value)
+
+# How each EXIF field used in the report is decoded. Numeric fields use _text
+# too, so rationals and ints pass through and stray bytes are still decoded.
+EXIF_DECODERS = {
+    ('0th', piexif.ImageIFD.Make): _text,
+    ('0th', piexif.ImageIFD.Model): _text,
+    ('0th', piexif.ImageIFD.ImageDescription): _text,
+    ('0th', piexif.ImageIFD.XPComment): _utf16_text,
+    ('Exif', piexif.ExifIFD.UserComment): _user_comment,
+    ('Exif', piexif.ExifIFD.FocalLength): _text,
+    ('Exif', piexif.ExifIFD.FNumber): _text,
+    ('Exif', piexif.ExifIFD.ExposureTime): _text,
+    ('Exif', piexif.ExifIFD.ISOSpeedRatings): _text,
+    ('Exif', piexif.ExifIFD.Flash): _text,
+}
+
+def get_exif(exif_dict, ifd, tag, default="NULL"):
+    """
+    Returns the decoded value of an EXIF tag listed in EXIF_DECODERS, or
+    `default` if the tag is missing or cannot be decoded.
+    """
+    try:
+        return EXIF_DECODERS[(ifd, tag)](exif_dict[ifd][tag])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return default
+
+def write_report(report_path, all_media_data):
+    """
+    Writes the report as 2-space indented UTF-8 JSON. Uses orjson when it is
+    installed, which encodes several times faster; the standard library
+    fallback writes the same bytes.
+    """
+    if orjson:
+        with open(report_path, "wb") as f:
+            f.write(orjson.dumps(all_media_data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(all_media_data, f, indent=2, ensure_ascii=False)
+
+def _extract_one(file_path, ext, exif_dict=None):
+    """
+    Extracts the metadata of a single media file with lowercase extension `ext`.
+    Runs in a worker process. An `exif_dict` already read by ExifTool is used
+    as-is; otherwise the EXIF is parsed here with piexif.
+    Returns (processed_filename, data, gps) where gps holds the raw
+    ((lat_dms, lon_dms), (lat_ref, lon_ref)) still to be converted and geocoded,
+    or None if the file could not be processed.
+    """
+    filename = os.path.basename(file_path)
+    is_video = ext in SUPPORTED_VIDEO_EXTS
+    gps = None
+
+    try:
+        # --- Initialize base data for all media types ---
+        data = {
+            "OriginalFileName": filename,
+            "Timestamp": "NULL",
+            "People": "NULL"
+        }
+
+        if is_video:
+            data['Timestamp'] = get_creation_date(file_path) or "NULL"
+            # Dimensions come from the container header parsed for the timestamp
+            metadata = read_video_metadata(file_path)
+            width = metadata.get('width') if metadata and metadata.has('width') else 0
+            height = metadata.get('height') if metadata and metadata.has('height') else 0
             
-            # --- Initialize base data for all media types ---
-            data = {
-                "OriginalFileName": filename,
-                "Timestamp": timestamp,
-                "People": "NULL"
-            }
-
-            if is_video:
-                cap = cv2.VideoCapture(file_path) # pylint: disable=no-member
-                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) # pylint: disable=no-member
-                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) # pylint: disable=no-member
-                cap.release()
-                
-                # For videos, many fields are not applicable
-                data.update({
-                    "Dimensions": f"{width}x{height}",
-                    "Location_Address": "N/A", "GPS_Location": "N/A",
-                    "DeviceMake": "N/A", "DeviceModel": "N/A",
-                    "FocalLength": "N/A", "Aperture": "N/A",
-                    "ShutterSpeed": "N/A", "ISO": "N/A",
-                    "Flash": "N/A", "Comments": "N/A"
-                })
-                processed_filename = os.path.splitext(filename)[0] + ".mp4"
-
-            else:  # It's an image, so we do the full, detailed extraction
+            # For videos, many fields are not applicable
+            data.update({
+                "Dimensions": f"{width}x{height}",
+                "Location_Address": "N/A", "GPS_Location": "N/A",
+                "DeviceMake": "N/A", "DeviceModel": "N/A",
+                "FocalLength": "N/A", "Aperture": "N/A",
+                "ShutterSpeed": "N/A", "ISO": "N/A",
+                "Flash": "N/A", "Comments": "N/A"
+            })
+            processed_filename = processed_name(filename, ext)
+
+        else:  # It's an image, so we do the full, detailed extraction
+            parse_exif = exif_dict is None
+            if parse_exif:
                 exif_dict = {}
-                img_obj = None
-                
-                if filename.lower().endswith('.heic'):
-                    heif_file = pillow_heif.read_heif(file_path)
-                    img_obj = heif_file
-                    if 'exif' in heif_file.info and heif_file.info['exif']:
-                        exif_dict = piexif.load(heif_file.info['exif'])
-                else:
-                    img_obj = Image.open(file_path)
-                    if 'exif' in img_obj.info and img_obj.info['exif']:
-                        exif_dict = piexif.load(img_obj.info['exif'])
 
-                def get_exif(ifd, tag, default="NULL"):
-                    try:
-                        val = exif_dict[ifd][tag]
-                        if isinstance(val, tuple):
-                            if tag in [piexif.ExifIFD.UserComment, piexif.ImageIFD.XPComment]:
-                                return bytes(val).decode('utf-16-le', 'ignore').strip('\x00')
-                            return val
-                        if isinstance(val, bytes):
-                            if tag == piexif.ExifIFD.UserComment:
-                                if val.startswith(b'UNICODE\x00'): return val[8:].decode('utf-16-le', 'ignore').strip('\x00')
-                                if val.startswith(b'ASCII\x00\x00\x00'): return val[8:].decode('ascii', 'ignore').strip('\x00')
-                            if tag == piexif.ImageIFD.XPComment: return val.decode('utf-16-le', 'ignore').strip('\x00')
-                            return val.decode('utf-8', 'ignore').strip('\x00')
-                        return val
-                    except (KeyError, IndexError, TypeError):
-                        return default
-
-                if filename.lower().endswith('.heic'):
+            # Only headers are read here; pixel data is never decoded.
+            if ext == '.heic':
+                # No 10-bit to 8-bit conversion is set up either, since nothing is decoded
+                heif_file = pillow_heif.open_heif(file_path, convert_hdr_to_8bit=False)
+                width, height = heif_file.size
+                if parse_exif and 'exif' in heif_file.info and heif_file.info['exif']:
+                    exif_dict = piexif.load(heif_file.info['exif'])
+            else:
+                with Image.open(file_path) as img_obj:
                     width, height = img_obj.size
-                else:
-                    width, height = img_obj.width, img_obj.height
-
-                data['Dimensions'] = f"{width}x{height}"
-                data['DeviceMake'] = get_exif('0th', piexif.ImageIFD.Make)
-                data['DeviceModel'] = get_exif('0th', piexif.ImageIFD.Model)
-                
-                focal_length_raw = get_exif('Exif', piexif.ExifIFD.FocalLength, (0, 1))
-                data['FocalLength'] = f"{int(focal_length_raw[0] / focal_length_raw[1])}mm" if focal_length_raw[1] > 0 else "NULL"
-                
-                aperture_raw = get_exif('Exif', piexif.ExifIFD.FNumber, (0, 1))
-                data['Aperture'] = f"f/{aperture_raw[0] / aperture_raw[1]:.1f}" if aperture_raw[1] > 0 else "NULL"
-                
-                shutter_raw = get_exif('Exif', piexif.ExifIFD.ExposureTime, (0, 1))
-                data['ShutterSpeed'] = f"1/{int(shutter_raw[1] / shutter_raw[0])}s" if shutter_raw[0] > 0 else "NULL"
-                
-                data['ISO'] = get_exif('Exif', piexif.ExifIFD.ISOSpeedRatings, "NULL")
-                data['Flash'] = "Flash Fired" if get_exif('Exif', piexif.ExifIFD.Flash, 0) & 1 else "No Flash"
-
-                comment_tags_to_check = [('Exif', piexif.ExifIFD.UserComment), ('0th', piexif.ImageIFD.ImageDescription), ('0th', piexif.ImageIFD.XPComment)]
-                comments = "NULL"
-                for ifd, tag in comment_tags_to_check:
-                    found_comment = get_exif(ifd, tag)
-                    if found_comment and found_comment != "NULL":
-                        comments = found_comment
-                        break
-                data['Comments'] = comments
-
-                gps_lat_dms = exif_dict.get('GPS', {}).get(piexif.GPSIFD.GPSLatitude)
-                gps_lon_dms = exif_dict.get('GPS', {}).get(piexif.GPSIFD.GPSLongitude)
-                if gps_lat_dms and gps_lon_dms:
-                    gps_lat_ref = exif_dict.get('GPS', {}).get(piexif.GPSIFD.GPSLatitudeRef, b'N').decode()
-                    gps_lon_ref = exif_dict.get('GPS', {}).get(piexif.GPSIFD.GPSLongitudeRef, b'E').decode()
-                    lat_dd = dms_to_dd(gps_lat_dms, gps_lat_ref)
-                    lon_dd = dms_to_dd(gps_lon_dms, gps_lon_ref)
-                    data['GPS_Location'] = f"{lat_dd:.4f}, {lon_dd:.4f}"
-                    try:
-                        data['Location_Address'] = get_addr(lat_dd, lon_dd)
-                    except Exception as geo_e:
-                        data['Location_Address'] = f"Geocoding failed: {geo_e}"
-                else:
-                    data['GPS_Location'] = "NULL"
-                    data['Location_Address'] = "NULL"
-
-                processed_filename = os.path.splitext(filename)[0] + ".png"
+                    if parse_exif and 'exif' in img_obj.info and img_obj.info['exif']:
+                        exif_dict = piexif.load(img_obj.info['exif'])
+
+            # Reuse the parsed EXIF instead of letting meta_reader reopen the file
+            data['Timestamp'] = get_creation_date(file_path, exif_dict) or "NULL"
+
+            data['Dimensions'] = f"{width}x{height}"
+            data['DeviceMake'] = get_exif(exif_dict, '0th', piexif.ImageIFD.Make)
+            data['DeviceModel'] = get_exif(exif_dict, '0th', piexif.ImageIFD.Model)
+            
+            focal_length_raw = get_exif(exif_dict, 'Exif', piexif.ExifIFD.FocalLength, (0, 1))
+            data['FocalLength'] = f"{int(focal_length_raw[0] / focal_length_raw[1])}mm" if focal_length_raw[1] > 0 else "NULL"
+            
+            aperture_raw = get_exif(exif_dict, 'Exif', piexif.ExifIFD.FNumber, (0, 1))
+            data['Aperture'] = f"f/{aperture_raw[0] / aperture_raw[1]:.1f}" if aperture_raw[1] > 0 else "NULL"
+            
+            shutter_raw = get_exif(exif_dict, 'Exif', piexif.ExifIFD.ExposureTime, (0, 1))
+            data['ShutterSpeed'] = f"1/{int(shutter_raw[1] / shutter_raw[0])}s" if shutter_raw[0] > 0 else "NULL"
+            
+            data['ISO'] = get_exif(exif_dict, 'Exif', piexif.ExifIFD.ISOSpeedRatings, "NULL")
+            data['Flash'] = "Flash Fired" if get_exif(exif_dict, 'Exif', piexif.ExifIFD.Flash, 0) & 1 else "No Flash"
+
+            comment_tags_to_check = [('Exif', piexif.ExifIFD.UserComment), ('0th', piexif.ImageIFD.ImageDescription), ('0th', piexif.ImageIFD.XPComment)]
+            comments = "NULL"
+            for ifd, tag in comment_tags_to_check:
+                found_comment = get_exif(exif_dict, ifd, tag)
+                if found_comment and found_comment != "NULL":
+                    comments = found_comment
+                    break
+            data['Comments'] = comments
+
+            gps_ifd = exif_dict.get('GPS') or {}
+            gps_lat_dms = gps_ifd.get(piexif.GPSIFD.GPSLatitude)
+            gps_lon_dms = gps_ifd.get(piexif.GPSIFD.GPSLongitude)
+            # Both are filled in by the driver, which converts all points at once
+            data['GPS_Location'] = "NULL"
+            data['Location_Address'] = "NULL"
+            if np.shape(gps_lat_dms) == (3, 2) and np.shape(gps_lon_dms) == (3, 2):
+                # Some cameras store the refs as str rather than bytes
+                gps_lat_ref = gps_ifd.get(piexif.GPSIFD.GPSLatitudeRef, b'N')
+                gps_lon_ref = gps_ifd.get(piexif.GPSIFD.GPSLongitudeRef, b'E')
+                if isinstance(gps_lat_ref, bytes): gps_lat_ref = gps_lat_ref.decode()
+                if isinstance(gps_lon_ref, bytes): gps_lon_ref = gps_lon_ref.decode()
+                gps = ((gps_lat_dms, gps_lon_dms), (gps_lat_ref, gps_lon_ref))
+
+            processed_filename = processed_name(filename, ext)
+
+        return processed_filename, data, gps
+
+    except Exception as e:
+        print(f"Could not process metadata for {filename}: {e}")
+        return None
 
+def generate_metadata_report(source_folder, output_folder):
+    """
+    Generates a JSON report of metadata from original source files.
+    Entries from a previous report are reused for source files whose size and
+    modification time match the ones recorded with the entry, so re-runs only
+    process new or replaced files.
+    """
+    print("\n--- Starting Metadata Report Generation ---")
+    report_path_json = os.path.join(output_folder, METADATA_REPORT_NAME)
+    previous_data = load_previous_report(report_path_json)
+    all_media_data = {}
+    source_stats = {}  # processed_filename -> [st_mtime_ns, st_size], stored with its entry
+    gps_points = {}  # processed_filename -> raw DMS and refs, converted after the pool
+
+    file_paths, exts = [], []
+    with os.scandir(source_folder) as entries:
+        for entry in entries:
+            ext = os.path.splitext(entry.name)[1].lower()
+            if (ext not in SUPPORTED_IMAGE_EXTS and ext not in SUPPORTED_VIDEO_EXTS) or not entry.is_file():
+                continue
+            processed_filename = processed_name(entry.name, ext)
+            stat = entry.stat()
+            source_stats[processed_filename] = [stat.st_mtime_ns, stat.st_size]
+            cached = previous_data.get(processed_filename)
+            # A different file copied in under the same name usually keeps its own,
+            # older mtime, so only an exact match of both counts as unchanged
+            if (cached and cached.get('OriginalFileName') == entry.name
+                    and cached.get('SourceStat') == source_stats[processed_filename]
+                    and not str(cached.get('Location_Address')).startswith("Geocoding failed")):
+                all_media_data[processed_filename] = cached
+                continue
+            all_media_data[processed_filename] = None  # Keeps listing order; filled in by the pool
+            file_paths.append(entry.path)
+            exts.append(ext)
+
+    # One ExifTool run covers every image when it is installed
+    exiftool_data = read_exif_batch([path for path, ext in zip(file_paths, exts) if ext in SUPPORTED_IMAGE_EXTS])
+    exif_dicts = [exiftool_data.get(os.path.normpath(path)) for path in file_paths]
+
+    if len(file_paths) < len(all_media_data):
+        print(f"Reusing metadata for {len(all_media_data) - len(file_paths)} unchanged file(s).")
+
+    # Files are independent, so EXIF parsing and probing run in parallel.
+    # Geocoding stays in this process because it must be rate-limited globally.
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(_extract_one, file_paths, exts, exif_dicts)
+        for result in tqdm(results, total=len(file_paths), desc="Reading metadata"):
+            if result is None:
+                continue
+            processed_filename, data, gps = result
+            data['SourceStat'] = source_stats[processed_filename]
             all_media_data[processed_filename] = data
-            print(f"Processed metadata for: {filename}")
+            if gps:
+                gps_points[processed_filename] = gps
+    # Drop the placeholders of files that could not be processed
+    all_media_data = {name: data for name, data in all_media_data.items() if data is not None}
 
-        except Exception as e:
-            print(f"Could not process metadata for {filename}: {e}")
+    # --- Convert all GPS points to decimal degrees in one pass ---
+    coords = {}  # processed_filename -> (lat, lon)
+    if gps_points:
+        dms, refs = zip(*gps_points.values())
+        dd = dms_to_dd(dms, refs)
+        for processed_filename, (lat_dd, lon_dd) in zip(gps_points, dd.tolist()):
+            if np.isfinite(lat_dd) and np.isfinite(lon_dd):
+                all_media_data[processed_filename]['GPS_Location'] = f"{lat_dd:.4f}, {lon_dd:.4f}"
+                coords[processed_filename] = (lat_dd, lon_dd)
+
+    # --- Resolve all GPS points in one batch (deduplicated and cached) ---
+    if coords:
+        try:
+            addresses = get_addrs(list(coords.values()))
+        except Exception as geo_e:
+            addresses = dict.fromkeys(coords.values(), f"Geocoding failed: {geo_e}")
+        for processed_filename, coord in coords.items():
+            all_media_data[processed_filename]['Location_Address'] = addresses[coord]
 
-    with open(report_path_json, "w", encoding="utf-8") as f:
-        json.dump(all_media_data, f, indent=4)
+    write_report(report_path_json, all_media_data)
     print(f"\nJSON report successfully generated at: {report_path_json}")
 
@@ -1,33 +1,133 @@
 """
 Main functions for timestamping images and videos.
-This version includes multithreaded video processing and configurable font sizes.
+This version includes pipelined video processing and configurable font sizes.
 """
+import functools
+import itertools
 import os
+import queue
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import piexif
 import pillow_heif
 import cv2
-from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from tqdm import tqdm
-from PIL import Image, ImageDraw, ImageFont, ImageOps
-from meta_reader import get_creation_date
+from PIL import ExifTags, Image, ImageDraw, ImageFont, ImageOps
+from meta_reader import get_creation_date, read_exif_batch
 from config import (FONT_WIDTH_RATIO, MIN_FONT_SIZE, OUTPUT_FOLDER_NAME,
                     VIDEO_FONT_SCALE_RATIO, VIDEO_FONT_THICKNESS_RATIO,
-                    MIN_VIDEO_FONT_SCALE, MIN_VIDEO_FONT_THICKNESS,MAX_PHOTOGRAMS_PER_BATCH)
+                    MIN_VIDEO_FONT_SCALE, MIN_VIDEO_FONT_THICKNESS,MAX_PHOTOGRAMS_PER_BATCH,
+                    METADATA_REPORT_NAME, SUPPORTED_IMAGE_EXTS, SUPPORTED_VIDEO_EXTS, PNG_COMPRESS_LEVEL)
 
-def process_video_frame(frame, text_info):
+FFMPEG_PATH = shutil.which('ffmpeg')
+# Fonts tried in order for image timestamps, falling back to PIL's built-in font
+FONT_NAMES = ["/System/Library/Fonts/Courier.ttc", "C:/Windows/Fonts/consola.ttf", "C:/Windows/Fonts/cour.ttf", "Consolas.ttf", "Courier New.ttf"]
+
+def build_text_overlay(text, pos, font_face, font_scale, color, thickness, frame_size):
+    """
+    Renders the timestamp (dark stroke, then coloured text) once into a small sprite,
+    so frames only need an alpha blend instead of re-rasterizing the glyphs.
+    `pos` is the text origin as passed to cv2.putText and `frame_size` is (width, height).
+    Returns (rows, cols, inv_alpha, premultiplied) with the slices clipped to the frame,
+    or None if the text lies entirely outside it.
+    """
+    stroke = thickness + 4
+    (text_width, text_height), baseline = cv2.getTextSize(text, font_face, font_scale, stroke) # pylint: disable=no-member
+    pad = stroke // 2 + 2
+    sprite_height, sprite_width = text_height + baseline + 2 * pad, text_width + 2 * pad
+    origin = (pad, pad + text_height)
+
+    # Coverage masks of the stroke and of the text, drawn exactly as on a frame
+    stroke_mask = np.zeros((sprite_height, sprite_width), np.uint8)
+    text_mask = np.zeros_like(stroke_mask)
+    cv2.putText(stroke_mask, text, origin, font_face, font_scale, 255, stroke, cv2.LINE_AA) # pylint: disable=no-member
+    cv2.putText(text_mask, text, origin, font_face, font_scale, 255, thickness, cv2.LINE_AA) # pylint: disable=no-member
+    stroke_mask = stroke_mask.astype(np.uint16)[..., None]
+    text_mask = text_mask.astype(np.uint16)[..., None]
+
+    # Painting black with the stroke mask and then the colour with the text mask
+    # reduces to frame * inv_alpha / 255 + premultiplied, all in uint8.
+    inv_alpha = np.repeat((255 - stroke_mask) * (255 - text_mask) // 255, 3, axis=2).astype(np.uint8)
+    premultiplied = (text_mask * np.array(color, np.uint16) // 255).astype(np.uint8)
+
+    # Clip the sprite to the frame
+    left, top = pos[0] - origin[0], pos[1] - origin[1]
+    width, height = frame_size
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + sprite_width, width), min(top + sprite_height, height)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    sprite_area = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+    return slice(y0, y1), slice(x0, x1), inv_alpha[sprite_area], premultiplied[sprite_area]
+
+def read_frames(cap, frame_queue, stop):
     """
-    Draws the timestamp on a single video frame. Called by worker threads.
+    Decodes every frame of an opened capture into `frame_queue`, then puts None
+    to mark the end. Runs on a background thread, and gives up as soon as
+    `stop` is set, even while waiting for room in the queue.
     """
-    text, pos, font_face, font_scale, color, thickness = text_info
-    # Add a dark stroke for readability
-    cv2.putText(frame, text, pos, font_face, font_scale, (0, 0, 0), thickness + 4, cv2.LINE_AA) # pylint: disable=no-member
-    # Add the main text color
-    cv2.putText(frame, text, pos, font_face, font_scale, color, thickness, cv2.LINE_AA) # pylint: disable=no-member
+    def put(item):
+        while not stop.is_set():
+            try:
+                frame_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    try:
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            put(frame)
+    finally:
+        put(None)
+
+def process_video_frame(frame, overlay):
+    """
+    Blends the pre-rendered timestamp overlay into a single video frame.
+    """
+    if overlay is None:
+        return frame
+    rows, cols, inv_alpha, premultiplied = overlay
+    roi = frame[rows, cols]
+    # OpenCV's saturating uint8 arithmetic avoids numpy's wide temporaries
+    cv2.add(cv2.multiply(roi, inv_alpha, scale=1 / 255), premultiplied, dst=roi) # pylint: disable=no-member
     return frame
 
+def timestamp_video_with_ffmpeg(input_path, final_video_path, text, font_size, border, margin):
+    """
+    Burns the timestamp into a video with a single ffmpeg run using the drawtext
+    filter, so no frame passes through Python. Audio is kept: copied as-is when
+    MP4 can hold it, otherwise re-encoded to AAC (e.g. PCM audio from .mov files).
+    Returns True on success, False on failure (e.g. ffmpeg built without drawtext).
+    """
+    # ':' separates filter options, so it is escaped inside the text
+    escaped_text = text.replace('\\', '\\\\').replace(':', '\\:')
+    # The border is drawn outside the glyphs, so it is included in the margin
+    drawtext = (f"drawtext=text='{escaped_text}':fontsize={font_size}:fontcolor=0xEBBC3C"
+                f":bordercolor=black:borderw={border}:x=w-tw-{margin + border}:y=h-{margin}-th")
+    for audio_codec in ('copy', 'aac'):
+        command = [FFMPEG_PATH, '-v', 'error', '-y', '-i', input_path, '-vf', drawtext,
+                   '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20', '-pix_fmt', 'yuv420p',
+                   '-c:a', audio_codec, final_video_path]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, check=False)
+        except OSError as e:
+            print(f"Could not run ffmpeg: {e}")
+            return False
+        if result.returncode == 0:
+            return True
+    print(f"ffmpeg could not timestamp {os.path.basename(input_path)}, using OpenCV: {result.stderr.strip()}")
+    return False
+
 def timestamp_video(input_path, output_path):
     """
-    Adds a timestamp to each frame of a video using multiple threads.
+    Adds a timestamp to each frame of a video. Uses ffmpeg's drawtext filter when
+    available, otherwise blends it into each frame with OpenCV while a second thread decodes.
     """
     print(f"Processing video: {os.path.basename(input_path)}")
     creation_date = get_creation_date(input_path)
@@ -48,8 +148,6 @@ def timestamp_video(input_path, output_path):
         
         output_filename = os.path.splitext(os.path.basename(input_path))[0] + ".mp4"
         final_video_path = os.path.join(output_path, output_filename)
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v') # pylint: disable=no-member
-        out = cv2.VideoWriter(final_video_path, fourcc, fps, (width, height)) # pylint: disable=no-member
 
         # ==================== MODIFICATION START ====================
         # --- Pre-calculate text styling using new config values ---
@@ -62,77 +160,130 @@ def timestamp_video(input_path, output_path):
         
         font_face = cv2.FONT_HERSHEY_SIMPLEX # pylint: disable=no-member
         text = creation_date
-        
-        (text_width, _), _ = cv2.getTextSize(text, font_face, font_scale, font_thickness) # pylint: disable=no-member
         margin = int(width * 0.02)
+
+        # drawtext sizes in pixels per em; 33 per unit of Hershey scale gives the same
+        # digit height, and a 2px border matches the stroke's overhang (thickness + 4).
+        if FFMPEG_PATH and timestamp_video_with_ffmpeg(input_path, final_video_path, text, int(font_scale * 33),
+                                                       2, margin):
+            cap.release()
+            print(f"\nSuccessfully timestamped video: {output_filename}")
+            return
+
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v') # pylint: disable=no-member
+        out = cv2.VideoWriter(final_video_path, fourcc, fps, (width, height)) # pylint: disable=no-member
+
+        (text_width, _), _ = cv2.getTextSize(text, font_face, font_scale, font_thickness) # pylint: disable=no-member
         x = width - text_width - margin
         y = height - margin 
         
-        text_info = (text, (x, y), font_face, font_scale, (60, 188, 235), font_thickness)
+        overlay = build_text_overlay(text, (x, y), font_face, font_scale, (60, 188, 235), font_thickness,
+                                       (width, height))
         # ===================== MODIFICATION END =====================
         
-        batch_size = MAX_PHOTOGRAMS_PER_BATCH
-        frames_batch = []
-        
-        with tqdm(total=total_frames, desc=f"Timestamping {os.path.basename(input_path)}") as pbar:
-            with ThreadPoolExecutor() as executor:
-                while cap.isOpened():
-                    ret, frame = cap.read()
-                    if not ret:
-                        if frames_batch:
-                            processed_frames = executor.map(process_video_frame, frames_batch, [text_info] * len(frames_batch))
-                            for proc_frame in processed_frames:
-                                out.write(proc_frame)
-                                pbar.update(1)
-                        break
-                    
-                    frames_batch.append(frame)
-                    
-                    if len(frames_batch) == batch_size:
-                        processed_frames = executor.map(process_video_frame, frames_batch, [text_info] * len(frames_batch))
-                        for proc_frame in processed_frames:
-                            out.write(proc_frame)
-                            pbar.update(1)
-                        frames_batch = []
-
-        cap.release()
-        out.release()
+        # Decoding runs on its own thread while this one blends and encodes.
+        # Both release the GIL inside OpenCV, and the bounded queue caps memory use.
+        frame_queue = queue.Queue(maxsize=MAX_PHOTOGRAMS_PER_BATCH)
+        stop = threading.Event()
+        reader = threading.Thread(target=read_frames, args=(cap, frame_queue, stop), daemon=True)
+        reader.start()
+
+        try:
+            with tqdm(total=total_frames, desc=f"Timestamping {os.path.basename(input_path)}") as pbar:
+                frame = frame_queue.get()
+                while frame is not None:
+                    out.write(process_video_frame(frame, overlay))
+                    pbar.update(1)
+                    frame = frame_queue.get()
+        finally:
+            # If encoding failed or was interrupted, stop the reader so it doesn't stay
+            # blocked on the full queue holding the capture and its decoded frames
+            stop.set()
+            reader.join()
+            cap.release()
+            out.release()
         print(f"\nSuccessfully timestamped video: {output_filename}")
 
     except Exception as e:
         print(f"Failed to process video {os.path.basename(input_path)}: {e}")
 
-# The rest of your timestamper.py file (timestamp_image, process_folder, etc.) remains the same.
-def timestamp_image(input_path, output_path):
-    creation_date = get_creation_date(input_path)
-    if not creation_date:
-        print(f"Skipping {os.path.basename(input_path)}: No creation date.")
-        return
+@functools.lru_cache(maxsize=1)
+def _pick_font_path():
+    """
+    Returns the first of FONT_NAMES that FreeType can load, or None if none can.
+    Resolved once per process instead of once per image.
+    """
+    for font_name in FONT_NAMES:
+        try:
+            ImageFont.truetype(font_name, size=MIN_FONT_SIZE)
+            return font_name
+        except IOError: continue
+    return None
+
+@functools.lru_cache(maxsize=64)
+def _load_font(font_path, size):
+    """
+    Loads a font once per size; images with the same dimensions share it.
+    """
+    if font_path is None: return ImageFont.load_default()
+    return ImageFont.truetype(font_path, size=size)
+
+def claim_output_path(output_path, filename, ext):
+    """
+    Atomically creates an empty output file named `filename` + `ext`, or
+    `filename` + 1, 2, ... + `ext` if that name is taken, and returns its path.
+    O_EXCL makes the check and the creation one step, so parallel workers
+    can never pick the same name.
+    """
+    for i in itertools.count():
+        candidate = os.path.join(output_path, f"{filename}{i or ''}{ext}")
+        try:
+            os.close(os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return candidate
+        except FileExistsError:
+            continue
+
+def timestamp_image(input_path, output_path, creation_date=None):
+    """
+    Draws the creation date on an image and saves it as PNG in `output_path`.
+    `creation_date` can be passed in when it was already read (e.g. by ExifTool);
+    otherwise it is read from the image's own EXIF.
+    Only skips and failures are printed; the caller shows overall progress.
+    """
     try:
-        exif_dict = {}
-        if input_path.lower().endswith('.heic'):
+        # The original EXIF bytes are copied to the output unchanged
+        if os.path.splitext(input_path)[1].lower() == '.heic':
             heif_file = pillow_heif.read_heif(input_path)
             image = Image.frombytes(heif_file.mode, heif_file.size, heif_file.data, "raw")
-            if 'exif' in heif_file.info: exif_dict = piexif.load(heif_file.info['exif'])
+            exif_bytes = heif_file.info.get('exif') or b''
         else:
             image = Image.open(input_path)
-            if 'exif' in image.info: exif_dict = piexif.load(image.info['exif'])
-        
-        image = ImageOps.exif_transpose(image)
-        if image.mode != 'RGBA': image = image.convert('RGBA')
+            exif_bytes = image.info.get('exif') or b''
+
+        if not creation_date:
+            # Parsed only for the date; a malformed block just means the mtime fallback
+            try:
+                exif_dict = piexif.load(exif_bytes) if exif_bytes else {}
+            except Exception:
+                exif_dict = {}
+            creation_date = get_creation_date(input_path, exif_dict)
+        if not creation_date:
+            print(f"Skipping {os.path.basename(input_path)}: No creation date.")
+            return
+
+        # exif_transpose copies the whole image even when it is already upright
+        if image.getexif().get(ExifTags.Base.Orientation, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+        # Only images with transparency need an alpha channel; RGB is smaller to draw on and compress
+        if image.has_transparency_data:
+            if image.mode != 'RGBA': image = image.convert('RGBA')
+        elif image.mode != 'RGB': image = image.convert('RGB')
 
         draw = ImageDraw.Draw(image)
         text = creation_date
         longest_side = max(image.width, image.height)
         font_size = max(MIN_FONT_SIZE, int(longest_side / FONT_WIDTH_RATIO))
-        font_names = ["/System/Library/Fonts/Courier.ttc", "C:/Windows/Fonts/consola.ttf", "C:/Windows/Fonts/cour.ttf", "Consolas.ttf", "Courier New.ttf"]
-        font = None
-        for font_name in font_names:
-            try:
-                font = ImageFont.truetype(font_name, size=font_size)
-                break
-            except IOError: continue
-        if not font: font = ImageFont.load_default()
+        font = _load_font(_pick_font_path(), font_size)
         text_bbox = draw.textbbox((0, 0), text, font=font, stroke_width=5)
         text_width = text_bbox[2] - text_bbox[0]
         text_height = text_bbox[3] - text_bbox[1]
@@ -142,45 +293,68 @@ def timestamp_image(input_path, output_path):
         final_draw = ImageDraw.Draw(image)
         final_draw.text((x, y), text, font=font, fill=(235, 188, 60), stroke_width=5, stroke_fill=(90, 70, 40))
         filename=os.path.splitext(os.path.basename(input_path))[0]
-        final_dir=os.path.join(output_path, filename + ".png")
-        i=0
-        while os.path.exists(final_dir):
-            i+=1
-            final_dir=os.path.join(output_path, filename + str(i) + ".png")        
-        exif_bytes_to_save = piexif.dump(exif_dict)
-        image.save(final_dir, 'PNG', exif=exif_bytes_to_save)
-        print(f"Successfully timestamped: {os.path.basename(final_dir)}")
+        final_dir=claim_output_path(output_path, filename, ".png")
+        try:
+            image.save(final_dir, 'PNG', exif=exif_bytes, compress_level=PNG_COMPRESS_LEVEL)
+        except Exception:
+            os.remove(final_dir)  # Don't leave the empty claimed file behind
+            raise
     except Exception as e:
         print(f"Failed to process {os.path.basename(input_path)}: {e}")
 
 def process_folder_for_timestamping(source_folder):
     output_folder = OUTPUT_FOLDER_NAME
     print("--- Starting Folder Cleaning Process ---")
-    folder_clearer(output_folder)
+    # The previous metadata report is kept so the reporter can reuse its entries
+    folder_clearer(output_folder, keep=(METADATA_REPORT_NAME,))
     print("--- Starting Media Timestamping Process ---")
     if not os.path.isdir(source_folder):
         print(f"Error: Source folder not found at '{source_folder}'")
         return None
     os.makedirs(output_folder, exist_ok=True)
 
-    supported_images = ('.heic', '.png', '.jpg', '.jpeg')
-    supported_videos = ('.mov', '.mp4')
-    for filename in os.listdir(source_folder):
-        input_file_path = os.path.join(source_folder, filename)
-        if filename.lower().endswith(supported_images):
-            timestamp_image(input_file_path, output_folder)
-        elif filename.lower().endswith(supported_videos):
-            timestamp_video(input_file_path, output_folder)
+    image_paths, video_paths = [], []
+    with os.scandir(source_folder) as entries:
+        for entry in entries:
+            ext = os.path.splitext(entry.name)[1].lower()
+            if ext in SUPPORTED_IMAGE_EXTS and entry.is_file():
+                image_paths.append(entry.path)
+            elif ext in SUPPORTED_VIDEO_EXTS and entry.is_file():
+                video_paths.append(entry.path)
+
+    # One ExifTool run reads the capture dates of every image when it is installed
+    exiftool_data = read_exif_batch(image_paths)
+    creation_dates = []
+    for input_file_path in image_paths:
+        exif_dict = exiftool_data.get(os.path.normpath(input_file_path))
+        creation_dates.append(get_creation_date(input_file_path, exif_dict) if exif_dict is not None else None)
+
+    # Images are independent and drawing/PNG compression hold the GIL, so they run in worker processes
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(timestamp_image, image_paths, itertools.repeat(output_folder), creation_dates,
+                               chunksize=4)
+        for _ in tqdm(results, total=len(image_paths), desc="Timestamping images"):
+            pass
+
+    # Videos are already pipelined (or handed to ffmpeg) internally, so they run one at a time
+    for input_file_path in video_paths:
+        timestamp_video(input_file_path, output_folder)
     
     print("--- Media Timestamping Complete ---")
     return output_folder
 
-def folder_clearer(folder_path):
+def folder_clearer(folder_path, keep=()):
     if not os.path.isdir(folder_path): return
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
-        try:
-            if os.path.isfile(file_path): os.remove(file_path)
-        except Exception as e:
-            print(f"Failed to delete {file_path}: {e}")
+    # The directory listing already knows each entry's type, so no extra stat per file
+    deleted = 0
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.name in keep: continue
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    os.remove(entry.path)
+                    deleted += 1
+            except Exception as e:
+                print(f"Failed to delete {entry.path}: {e}")
+    print(f"Deleted {deleted} file(s) from '{folder_path}'.")
 